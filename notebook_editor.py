@@ -4,14 +4,266 @@
 Работаем без внешних зависимостей, сохраняем структуру JSON.
 """
 import json
+import copy
 import argparse
 import sys
 import os
-import difflib
+import io
+import importlib
 import re
-import base64
+import binascii
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+# Опциональные модули (jiter, orjson, ijson, cdifflib, pybase64) и difflib
+# импортируем по требованию через _optional_import — без них всё работает
+_optional_modules: Dict[str, Any] = {}
+
+# Размер куска при потоковом декодировании base64 (кратен 4)
+_B64_CHUNK_SIZE = 1 << 16
+# Байты вне алфавита base64 — декодер их пропускает, убираем заранее
+_B64_IGNORED = bytes(
+    b for b in range(256)
+    if b not in b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+)
+
+# Начало строки в смысле str.splitlines (а не только после '\n')
+_LINE_START = r'(?:\A|(?<=\n)|(?<=\r)(?!\n)|(?<=[\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]))'
+# Пробельный символ, не являющийся переносом строки
+_INLINE_SPACE = r'[^\S\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]'
+# Дальше в строке есть непробельный символ (line.strip() не пуст)
+_NONBLANK_AHEAD = r'(?=' + _INLINE_SPACE + r'*\S)'
+_NONBLANK_LINE_START = re.compile(_LINE_START + _NONBLANK_AHEAD)
+
+# Любой перенос строки в смысле str.splitlines
+_LINE_BREAK = re.compile(r'[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+# Первый непробельный символ (в смысле str.strip)
+_NON_SPACE = re.compile(r'\S')
+
+# Префикс ijson для значений в output['data'] ячеек
+_OUTPUT_DATA_PREFIX = 'cells.item.outputs.item.data.'
+
+# Минимальная структура нового ноутбука
+_DEFAULT_NOTEBOOK = {
+    "cells": [],
+    "metadata": {
+        "kernelspec": {
+            "display_name": "Python 3",
+            "language": "python",
+            "name": "python3"
+        },
+        "language_info": {
+            "codemirror_mode": {"name": "ipython", "version": 3},
+            "file_extension": ".py",
+            "mimetype": "text/x-python",
+            "name": "python",
+            "nbconvert_exporter": "python",
+            "pygments_lexer": "ipython3",
+            "version": "3.8.0"
+        }
+    },
+    "nbformat": 4,
+    "nbformat_minor": 5
+}
+
+# Если попаданий больше, чем строк / это число, search разбивает текст
+# через splitlines, а не вырезает строки вокруг каждого попадания
+_SPLIT_MIN_HIT_RATIO = 8
+
+# Поля, без которых ячейка невалидна
+_REQUIRED_CELL_FIELDS = frozenset(('cell_type', 'source'))
+
+# Файлы меньше этого размера stdlib json парсит быстрее, чем импортируется
+# jiter/orjson (~7 мс на импорт против ~7 мс/МБ разбора stdlib)
+_FAST_PARSER_MIN_SIZE = 1 << 20
+
+# Ноутбуки меньше этого размера парсятся быстрее, чем читается кэш
+_CACHE_MIN_SIZE = 1 << 20
+# Версия формата записи в кэше — меняем вместе с её содержимым
+_CACHE_VERSION = 2
+# Кэш окупается, только если бинарные выводы — не меньше этой доли файла:
+# иначе pickle читается не быстрее, чем jiter парсит сам ноутбук
+_CACHE_MIN_BINARY_SHARE = 0.5
+# Сколько записей держим в каталоге кэша — старые удаляем
+_CACHE_MAX_ENTRIES = 16
+# Непустое значение переменной окружения отключает кэш
+_CACHE_DISABLE_ENV = 'IPYNB_AI_NO_CACHE'
+
+
+def _optional_import(name: str) -> Any:
+    """
+    Импортируем модуль при первом обращении и запоминаем результат.
+    
+    params:
+        name: Имя модуля
+    return:
+        Модуль или None если он не установлен
+    """
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+
+def _loads(raw: bytes) -> Any:
+    """
+    Парсим JSON из байтов самым быстрым доступным парсером:
+    jiter, затем orjson, затем stdlib json. Небольшие файлы сразу отдаём
+    stdlib — импорт быстрого парсера дороже самого разбора.
+    
+    params:
+        raw: Содержимое файла в байтах
+    return:
+        Распарсенный объект
+    """
+    if len(raw) < _FAST_PARSER_MIN_SIZE:
+        return json.loads(raw)
+    jiter = _optional_import('jiter')
+    if jiter is not None:
+        try:
+            # Ключи в ноутбуке повторяются тысячи раз — интернируем их
+            return jiter.from_json(raw, cache_mode="keys")
+        except ValueError:
+            # Ошибку в понятном формате отдаст stdlib
+            pass
+    else:
+        orjson = _optional_import('orjson')
+        if orjson is not None:
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                # orjson строже stdlib (NaN, большие int) — даём шанс stdlib
+                pass
+    return json.loads(raw)
+
+
+def _a2b_base64(data: bytes) -> bytes:
+    """
+    Декодируем base64 через pybase64 (SIMD), если он установлен, иначе binascii.
+    Результат всегда совпадает с binascii.a2b_base64.
+    
+    params:
+        data: Байты base64 без пробелов и переносов
+    return:
+        Декодированные байты
+    """
+    pybase64 = _optional_import('pybase64')
+    if pybase64 is not None:
+        try:
+            return pybase64.b64decode(data, validate=True)
+        except binascii.Error:
+            # Нестандартный паддинг binascii разбирает мягче — отдаём ему
+            pass
+    return binascii.a2b_base64(data)
+
+
+def _cache_key(stat: os.stat_result) -> tuple:
+    """
+    Ключ записи в кэше для версии файла. Одного mtime и размера мало:
+    правка того же размера при грубом mtime их не меняет. save() подменяет
+    файл через os.replace — меняется inode, а любая запись меняет ctime.
+    
+    params:
+        stat: Результат stat() ноутбука
+    return:
+        Кортеж, совпадающий только для той же версии файла
+    """
+    return (_CACHE_VERSION, stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+
+def _has_rare_line_break(text: str) -> bool:
+    """
+    Проверяем, есть ли в тексте переносы кроме '\n' (\r, \f, \u2028, ...).
+    Поиск одиночного символа идёт через memchr — быстрее одного прохода regex.
+    Проверки развёрнуты вручную: генератор в any() дороже самих поисков,
+    а \x85 и \u2028/\u2029 в ASCII-строке (isascii() — O(1)) не ищем вовсе.
+    
+    params:
+        text: Проверяемая строка
+    return:
+        True если splitlines разобьёт текст не только по '\n'
+    """
+    return ('\r' in text or '\x0b' in text or '\x0c' in text
+            or '\x1c' in text or '\x1d' in text or '\x1e' in text
+            or (not text.isascii()
+                and ('\x85' in text or '\u2028' in text or '\u2029' in text)))
+
+
+def _json_value(value: Any, level: int) -> str:
+    """
+    Сериализуем значение как json.dumps(value, ensure_ascii=False, indent=2),
+    вложенное на заданную глубину.
+    
+    params:
+        value: JSON-совместимое значение
+        level: Глубина вложенности значения в документе
+    return:
+        JSON-текст значения
+    """
+    if isinstance(value, str):
+        return json.encoder.encode_basestring(value)
+    # Переносы бывают только между элементами — сдвигаем их на отступ уровня
+    return json.dumps(value, ensure_ascii=False, indent=2).replace('\n', '\n' + '  ' * level)
+
+
+def _format_range_unified(start: int, stop: int) -> str:
+    """
+    Форматируем диапазон строк для заголовка hunk, как difflib.
+    
+    params:
+        start: Начало диапазона (0-indexed)
+        stop: Конец диапазона (exclusive)
+    return:
+        Строка вида 'N' или 'N,M'
+    """
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _unified_diff(matcher: Any, a: List[str], b: List[str],
+                  fromfile: str, tofile: str):
+    """
+    Строим unified diff по готовому matcher'у — тот же вывод,
+    что difflib.unified_diff(..., lineterm='').
+    
+    params:
+        matcher: SequenceMatcher (или совместимый) для a и b
+        a: Исходные строки
+        b: Новые строки
+        fromfile: Имя исходного файла в заголовке
+        tofile: Имя нового файла в заголовке
+    return:
+        Генератор строк diff
+    """
+    started = False
+    for group in matcher.get_grouped_opcodes(3):
+        if not started:
+            started = True
+            yield f"--- {fromfile}"
+            yield f"+++ {tofile}"
+        first, last = group[0], group[-1]
+        file1_range = _format_range_unified(first[1], last[2])
+        file2_range = _format_range_unified(first[3], last[4])
+        yield f"@@ -{file1_range} +{file2_range} @@"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
 
 
 class NotebookEditor:
@@ -20,17 +272,98 @@ class NotebookEditor:
     Загружаем, редактируем, сохраняем ноутбуки программно.
     """
     
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, read_only: bool = False):
         """
         Инициализируем редактор ноутбука.
         
         params:
             filepath: Путь к .ipynb файлу
+            read_only: Открываем только для чтения — бинарные выводы можно
+                не загружать, сохранение запрещено (по умолчанию False)
         return:
             None
         """
         self.filepath = Path(filepath)
-        self.data = self._load_notebook()
+        self.read_only = read_only
+        # Документ разбираем при первом обращении к self.data
+        self._data: Optional[Dict[str, Any]] = None
+        # Ячейки, чей source хранится строкой до сохранения
+        self._unsplit_cells: List[Dict[str, Any]] = []
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """
+        Данные ноутбука. Файл загружаем целиком при первом обращении.
+        
+        params:
+            None
+        return:
+            Dict с данными ноутбука
+        """
+        if self._data is None:
+            self._data = self._load_notebook()
+        return self._data
+
+    @data.setter
+    def data(self, value: Dict[str, Any]):
+        self._data = value
+
+    def _get_cell(self, index: int) -> Optional[Dict[str, Any]]:
+        """
+        Получаем ячейку по индексу. Пока документ не загружен, достаём из файла
+        только её (см. _load_cell), иначе берём из self.data.
+        
+        params:
+            index: Индекс ячейки
+        return:
+            Dict ячейки или None если индекс вне диапазона
+        """
+        if self._data is None:
+            cell = self._load_cell(index)
+            if cell is not None:
+                return cell
+        cells = self.data.get('cells', [])
+        if 0 <= index < len(cells):
+            return cells[index]
+        return None
+
+    def _load_cell(self, index: int) -> Optional[Dict[str, Any]]:
+        """
+        Потоково достаём одну ячейку через ijson, не строя остальной документ.
+        Разбор останавливается сразу после нужной ячейки.
+        
+        params:
+            index: Индекс ячейки
+        return:
+            Dict ячейки или None если ijson не установлен или есть jiter/orjson,
+            файла нет, файл небольшой, ijson не смог его разобрать
+            или ячейки с таким индексом нет
+        """
+        if index < 0 or not self.filepath.exists():
+            return None
+        # На небольших файлах полный разбор через json быстрее, а на больших
+        # jiter/orjson разбирают весь файл быстрее, чем ijson доходит до ячейки
+        if self.filepath.stat().st_size < _CACHE_MIN_SIZE:
+            return None
+        if _optional_import('jiter') is not None or _optional_import('orjson') is not None:
+            return None
+        ijson = _optional_import('ijson')
+        if ijson is None:
+            return None
+        try:
+            with open(self.filepath, 'rb') as f:
+                # Предыдущие ячейки собираются в C и сразу отбрасываются
+                for i, cell in enumerate(ijson.items(f, 'cells.item', use_float=True)):
+                    if i == index:
+                        return cell
+        except ijson.JSONError:
+            # yajl не принимает NaN/Infinity — отдаём полному разбору,
+            # он же сообщит о действительно битом файле
+            return None
+        except Exception as e:
+            print(f"Error loading file: {e}")
+            sys.exit(1)
+        return None
 
     def _load_notebook(self) -> Dict[str, Any]:
         """
@@ -43,31 +376,36 @@ class NotebookEditor:
         """
         if not self.filepath.exists():
             # Создаём минимальную структуру ноутбука
-            return {
-                "cells": [],
-                "metadata": {
-                    "kernelspec": {
-                        "display_name": "Python 3",
-                        "language": "python",
-                        "name": "python3"
-                    },
-                    "language_info": {
-                        "codemirror_mode": {"name": "ipython", "version": 3},
-                        "file_extension": ".py",
-                        "mimetype": "text/x-python",
-                        "name": "python",
-                        "nbconvert_exporter": "python",
-                        "pygments_lexer": "ipython3",
-                        "version": "3.8.0"
-                    }
-                },
-                "nbformat": 4,
-                "nbformat_minor": 5
-            }
+            return copy.deepcopy(_DEFAULT_NOTEBOOK)
         
+        # Большие ноутбуки на чтение берём из кэша, если файл не менялся
+        stat = None
+        if self.read_only and not os.environ.get(_CACHE_DISABLE_ENV):
+            stat = self.filepath.stat()
+            if stat.st_size < _CACHE_MIN_SIZE:
+                stat = None
+            else:
+                cached = self._read_cache(stat)
+                if cached is not None:
+                    return cached
+
+        # Цикл событий ijson в разы медленнее jiter/orjson даже на больших
+        # файлах — стримим только большие файлы и только без быстрого парсера
+        ijson = None
+        if stat is not None and _optional_import('jiter') is None and _optional_import('orjson') is None:
+            ijson = _optional_import('ijson')
         try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            data, binary_size = None, 0
+            if ijson is not None:
+                try:
+                    data, binary_size = self._load_notebook_lazy()
+                except ijson.JSONError:
+                    # yajl не принимает NaN/Infinity — их разберёт _loads
+                    data = None
+            if data is None:
+                data = _loads(self.filepath.read_bytes())
+                if stat is not None:
+                    binary_size = self._strip_binary_outputs(data)
         except json.JSONDecodeError:
             print(f"Error: File '{self.filepath}' is not a valid JSON file.")
             sys.exit(1)
@@ -75,6 +413,165 @@ class NotebookEditor:
             print(f"Error loading file: {e}")
             sys.exit(1)
 
+        # Кэшируем только ноутбуки, которые без картинок стали заметно меньше
+        if stat is not None and binary_size >= stat.st_size * _CACHE_MIN_BINARY_SHARE:
+            self._write_cache(stat, data)
+        return data
+
+    def _strip_binary_outputs(self, data: Dict[str, Any]) -> int:
+        """
+        Заменяем image/* и application/pdf в выводах пустыми строками —
+        команды на чтение их не показывают.
+        
+        params:
+            data: Данные ноутбука (меняются на месте)
+        return:
+            Сколько символов бинарных данных убрано
+        """
+        removed = 0
+        for cell in data.get('cells', []):
+            for output in cell.get('outputs', []):
+                output_data = output.get('data')
+                if output_data:
+                    for key, value in output_data.items():
+                        if key.startswith('image/') or key == 'application/pdf':
+                            removed += len(self._source_to_string(value))
+                            output_data[key] = ""
+        return removed
+
+    def _cache_path(self) -> Path:
+        """
+        Путь к файлу кэша ноутбука: ~/.cache/ipynb-ai/<sha1 абсолютного пути>.pkl
+        
+        params:
+            None
+        return:
+            Путь к файлу кэша
+        """
+        import hashlib
+        cache_root = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+        digest = hashlib.sha1(str(self.filepath.resolve()).encode('utf-8')).hexdigest()
+        return Path(cache_root) / 'ipynb-ai' / f"{digest}.pkl"
+
+    def _read_cache(self, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        """
+        Читаем ноутбук из кэша, если он записан для той же версии файла.
+        
+        params:
+            stat: Результат stat() ноутбука
+        return:
+            Dict с данными ноутбука без бинарных данных или None
+        """
+        import pickle
+        try:
+            with open(self._cache_path(), 'rb') as f:
+                entry = pickle.load(f)
+            if entry['key'] == _cache_key(stat):
+                return entry['data']
+        except Exception:
+            # Нет кэша, он битый или чужого формата — просто парсим файл
+            pass
+        return None
+
+    def _write_cache(self, stat: os.stat_result, data: Dict[str, Any]):
+        """
+        Сохраняем ноутбук без бинарных данных в кэш и удаляем старые записи.
+        Ошибки записи игнорируем.
+        
+        params:
+            stat: Результат stat() ноутбука, снятый до чтения файла
+            data: Данные ноутбука без бинарных выводов
+        return:
+            None
+        """
+        import pickle
+        try:
+            cache_path = self._cache_path()
+            # В кэше весь код и текстовые выводы — доступ только владельцу
+            cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        except (OSError, RuntimeError):
+            # Кэш — только ускорение: недоступный каталог не мешает работе
+            return
+        # Пишем через временный файл — параллельный запуск не прочтёт половину
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        entry = {'key': _cache_key(stat), 'data': data}
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+        self._prune_cache(cache_path.parent)
+
+    def _prune_cache(self, cache_dir: Path):
+        """
+        Оставляем в каталоге кэша не больше _CACHE_MAX_ENTRIES самых свежих записей.
+        
+        params:
+            cache_dir: Каталог кэша
+        return:
+            None
+        """
+        try:
+            entries = []
+            for entry in os.scandir(cache_dir):
+                if entry.name.endswith('.pkl'):
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+        except OSError:
+            return
+        if len(entries) <= _CACHE_MAX_ENTRIES:
+            return
+        entries.sort(reverse=True)
+        for _, path in entries[_CACHE_MAX_ENTRIES:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                # Запись уже удалил параллельный запуск
+                pass
+
+    def _load_notebook_lazy(self) -> Tuple[Dict[str, Any], int]:
+        """
+        Потоково парсим ноутбук через ijson, пропуская бинарные выводы.
+        Ключи image/* и application/pdf остаются, но с пустым значением.
+        
+        params:
+            None
+        return:
+            Dict с данными ноутбука без бинарных данных и сколько символов
+            бинарных данных пропущено
+        """
+        ijson = _optional_import('ijson')
+        builder = ijson.ObjectBuilder()
+        skip_depth = 0
+        skipped = 0
+        with open(self.filepath, 'rb') as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                # Пропускаем события внутри вырезаемого массива
+                if skip_depth:
+                    if event == 'string':
+                        skipped += len(value)
+                    elif event in ('start_array', 'start_map'):
+                        skip_depth += 1
+                    elif event in ('end_array', 'end_map'):
+                        skip_depth -= 1
+                    continue
+                if event in ('string', 'start_array') and prefix.startswith(_OUTPUT_DATA_PREFIX):
+                    key = prefix[len(_OUTPUT_DATA_PREFIX):]
+                    if key.startswith('image/') or key == 'application/pdf':
+                        if event == 'start_array':
+                            skip_depth = 1
+                        else:
+                            skipped += len(value)
+                        builder.event('string', '')
+                        continue
+                builder.event(event, value)
+        return builder.value, skipped
+
     def save(self):
         """
         Сохраняем текущее состояние ноутбука в файл.
@@ -84,16 +581,47 @@ class NotebookEditor:
         return:
             None
         """
+        if self.read_only:
+            print(f"Error: Notebook '{self.filepath}' is opened read-only.")
+            sys.exit(1)
+        self._materialize_sources_for_save()
+        # Сериализуем stdlib json: orjson умеет только indent=2,
+        # а Jupyter пишет indent=1 — не хотим переформатировать весь файл
+        encoder = json.JSONEncoder(indent=1, ensure_ascii=False)
+        # Пишем во временный файл рядом и атомарно подменяем оригинал,
+        # чтобы при сбое не остался обрезанный ноутбук. Симлинк разрешаем,
+        # иначе os.replace заменит сам симлинк обычным файлом
+        target_path = self.filepath.resolve()
+        tmp_path = target_path.with_name(f"{target_path.name}.{os.getpid()}.tmp")
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=1, ensure_ascii=False)
-            # Добавляем перенос строки в конец файла
-            with open(self.filepath, 'a', encoding='utf-8') as f:
+            # Пишем куски iterencode потоком, не собирая документ в одну строку
+            with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.writelines(encoder.iterencode(self.data))
                 f.write('\n')
+            if target_path.exists():
+                os.chmod(tmp_path, target_path.stat().st_mode & 0o7777)
+            os.replace(tmp_path, target_path)
         except Exception as e:
+            if tmp_path.exists():
+                tmp_path.unlink()
             print(f"Error saving file: {e}")
             sys.exit(1)
 
+    def _materialize_sources_for_save(self):
+        """
+        Разбиваем строковые source изменённых ячеек в список строк перед записью,
+        как это делает Jupyter. Остальные ячейки не трогаем.
+        
+        params:
+            None
+        return:
+            None
+        """
+        for cell in self._unsplit_cells:
+            if isinstance(cell.get('source'), str):
+                cell['source'] = self._normalize_source(cell['source'])
+        self._unsplit_cells.clear()
+
     def _normalize_source(self, source: Union[str, List[str]]) -> List[str]:
         """
         Нормализуем source в список строк с переносами.
@@ -122,6 +650,55 @@ class NotebookEditor:
             return "".join(source)
         return source
 
+    def _count_lines(self, text: str, rare: Optional[bool] = None) -> int:
+        """
+        Считаем строки как len(text.splitlines()). Если переносы только '\n',
+        обходимся без создания списка.
+        
+        params:
+            text: Исходная строка
+            rare: Уже посчитанный _has_rare_line_break(text) (None — проверяем сами)
+        return:
+            Количество строк
+        """
+        if rare is None:
+            rare = _has_rare_line_break(text)
+        # \r, \f, \u2028 и т.п. splitlines тоже считает переносами
+        if rare:
+            return len(text.splitlines())
+        count = text.count('\n')
+        if text and not text.endswith('\n'):
+            count += 1
+        return count
+
+    def _first_nonblank_lines(self, text: Union[str, List[str]], count: int) -> List[str]:
+        """
+        Берём первые непустые строки текста, не разбивая его целиком.
+        Строки те же, что дал бы _normalize_source, но без переносов в конце.
+        
+        params:
+            text: Строка или список строк
+            count: Сколько строк нужно
+        return:
+            Не больше count строк, содержащих непробельные символы
+        """
+        lines = []
+        if isinstance(text, list):
+            for line in text:
+                if _NON_SPACE.search(line):
+                    lines.append(line)
+                    if len(lines) >= count:
+                        break
+            return lines
+        # Прыгаем сразу к началам непустых строк и режем до ближайшего переноса
+        for match in _NONBLANK_LINE_START.finditer(text):
+            start = match.start()
+            end = _LINE_BREAK.search(text, start)
+            lines.append(text[start:end.start() if end else len(text)])
+            if len(lines) >= count:
+                break
+        return lines
+
     def _get_cell_outputs(self, outputs: List[Dict[str, Any]]) -> str:
         """
         Парсим выводы ячейки в читаемую строку.
@@ -134,13 +711,21 @@ class NotebookEditor:
         result = []
         for i, output in enumerate(outputs):
             output_type = output.get('output_type', '')
-            result.append(f"--- Output {i} ({output_type}) ---")
-            
+            # Частые случаи — поток и чистый text/plain — собираем блок одной строкой
             if output_type == 'stream':
                 text = self._source_to_string(output.get('text', []))
-                result.append(text.rstrip())
-                
-            elif output_type in ('execute_result', 'display_data'):
+                result.append(f"--- Output {i} (stream) ---\n{text.rstrip()}\n")
+                continue
+            if output_type in ('execute_result', 'display_data'):
+                data = output.get('data', {})
+                if len(data) == 1 and 'text/plain' in data:
+                    text = self._source_to_string(data['text/plain'])
+                    result.append(f"--- Output {i} ({output_type}) ---\n{text.rstrip()}\n")
+                    continue
+            
+            result.append(f"--- Output {i} ({output_type}) ---")
+            
+            if output_type in ('execute_result', 'display_data'):
                 data = output.get('data', {})
                 # Пробуем получить текстовое представление
                 if 'text/plain' in data:
@@ -148,11 +733,10 @@ class NotebookEditor:
                     result.append(text.rstrip())
                 
                 # Проверяем наличие изображений или бинарных данных
-                binary_keys = [k for k in data.keys() if k.startswith('image/') or k == 'application/pdf']
-                if binary_keys:
-                    for key in binary_keys:
-                        result.append(f"[BINARY DATA DETECTED: {key}]")
-                        result.append(f"(Use 'save-output' command to extract this data)")
+                binary_keys = tuple(k for k in data if k.startswith('image/') or k == 'application/pdf')
+                for key in binary_keys:
+                    result.append(f"[BINARY DATA DETECTED: {key}]")
+                    result.append(f"(Use 'save-output' command to extract this data)")
                 
                 if not 'text/plain' in data and not binary_keys:
                      result.append(f"[Complex Data: {list(data.keys())}]")
@@ -179,21 +763,36 @@ class NotebookEditor:
             None
         """
         cells = self.data.get('cells', [])
-        print(f"Total cells: {len(cells)}")
+        # Копим вывод в буфере и пишем в stdout одним вызовом
+        buf = io.StringIO()
+        buf.write(f"Total cells: {len(cells)}\n")
         for i, cell in enumerate(cells):
             cell_type = cell.get('cell_type', 'unknown').upper()
-            source = self._normalize_source(cell.get('source', []))
+            source = self._source_to_string(cell.get('source', []))
             
             # Превью кода (первые 2 + последние 2 строки)
-            source_lines = [line.rstrip() for line in source]
-            if not source_lines:
+            # Считаем строки без разбиения всего source на список
+            rare = _has_rare_line_break(source)
+            line_count = self._count_lines(source, rare)
+            if not line_count:
                 preview_source = ""
-            elif len(source_lines) <= 4:
-                preview_source = "\n".join([f"    | {line}" for line in source_lines])
+            elif line_count <= 4:
+                preview_source = "\n".join([f"    | {line.rstrip()}" for line in source.splitlines()])
+            elif rare:
+                # Строки не только по '\n' — срезы по позициям не подходят
+                source_lines = source.splitlines()
+                preview_lines = source_lines[:2] + ["..."] + source_lines[-2:]
+                preview_source = "\n".join([f"    | {line.rstrip()}" for line in preview_lines])
             else:
-                first_two = [f"    | {line}" for line in source_lines[:2]]
-                last_two = [f"    | {line}" for line in source_lines[-2:]]
-                preview_source = "\n".join(first_two + ["    | ..."] + last_two)
+                # Срезаем только нужные строки по позициям переносов
+                end1 = source.find('\n')
+                end2 = source.find('\n', end1 + 1)
+                end = len(source) - 1 if source.endswith('\n') else len(source)
+                start2 = source.rfind('\n', 0, end)
+                start1 = source.rfind('\n', 0, start2)
+                preview_lines = [source[:end1], source[end1 + 1:end2], "...",
+                                 source[start1 + 1:start2], source[start2 + 1:end]]
+                preview_source = "\n".join([f"    | {line.rstrip()}" for line in preview_lines])
 
             # Превью вывода
             outputs = cell.get('outputs', [])
@@ -206,28 +805,29 @@ class NotebookEditor:
                 text_lines_found = []
                 
                 for output in outputs:
-                    # Извлекаем текст
-                    text_content = []
-                    if output.get('output_type') == 'stream':
-                        text_content = self._normalize_source(output.get('text', []))
-                    elif 'data' in output and 'text/plain' in output['data']:
-                        text_content = self._normalize_source(output['data']['text/plain'])
-                    
-                    if text_content and len(text_lines_found) < 2:
-                        for line in text_content:
-                            if line.strip() and len(text_lines_found) < 2:
-                                text_lines_found.append(line.rstrip())
+                    # Извлекаем текст, пока не набрали две строки
+                    if len(text_lines_found) < 2:
+                        text_content = None
+                        if output.get('output_type') == 'stream':
+                            text_content = output.get('text', [])
+                        elif 'data' in output and 'text/plain' in output['data']:
+                            text_content = output['data']['text/plain']
+                        
+                        if text_content:
+                            text_lines_found.extend(self._first_nonblank_lines(
+                                text_content, 2 - len(text_lines_found)))
                     
                     # Определяем наличие изображений
-                    if 'data' in output:
-                        for key in output['data']:
-                            if key.startswith('image/'):
-                                has_image = True
-                                break
+                    if not has_image and 'data' in output:
+                        has_image = any(key.startswith('image/') for key in output['data'])
+                    
+                    # Всё нужное для превью уже собрано
+                    if has_image and len(text_lines_found) >= 2:
+                        break
                                 
                 if text_lines_found:
                     for line in text_lines_found:
-                        output_info.append(f"    > {line[:80]}")
+                        output_info.append(f"    > {line.rstrip()[:80]}")
                     if len(text_lines_found) >= 2:
                          output_info.append("    > ...")
 
@@ -238,17 +838,19 @@ class NotebookEditor:
                     output_info.append("    > [Data present]")
             
             # Выводим информацию о ячейке
-            print(f"[{i}] {cell_type}:")
+            buf.write(f"[{i}] {cell_type}:\n")
             if preview_source:
-                print(preview_source)
+                buf.write(preview_source + "\n")
             if output_info:
-                print("\n".join(output_info))
-            print("")  # Разделитель
+                buf.write("\n".join(output_info) + "\n")
+            buf.write("\n")  # Разделитель
 
             if limit > 0 and i >= limit - 1:
-                print("... (limit reached)")
+                buf.write("... (limit reached)\n")
                 break
 
+        sys.stdout.write(buf.getvalue())
+
     def save_output(self, cell_index: int, output_index: int, to_file: str):
         """
         Сохраняем бинарный вывод (изображение) в файл.
@@ -260,12 +862,11 @@ class NotebookEditor:
         return:
             None
         """
-        cells = self.data.get('cells', [])
-        if cell_index < 0 or cell_index >= len(cells):
+        cell = self._get_cell(cell_index)
+        if cell is None:
             print(f"Error: Cell index {cell_index} out of range.")
             sys.exit(1)
             
-        cell = cells[cell_index]
         outputs = cell.get('outputs', [])
         
         if output_index < 0 or output_index >= len(outputs):
@@ -276,11 +877,7 @@ class NotebookEditor:
         data = output.get('data', {})
         
         # Ищем подходящий бинарный ключ
-        target_key = None
-        for key in data.keys():
-            if key.startswith('image/') or key == 'application/pdf':
-                target_key = key
-                break
+        target_key = next((k for k in data if k.startswith('image/') or k == 'application/pdf'), None)
         
         if not target_key:
             print(f"Error: No supported binary data found in Output {output_index} of Cell {cell_index}.")
@@ -289,19 +886,41 @@ class NotebookEditor:
             
         b64_data = data[target_key]
         
-        # Объединяем если это список
+        # Список строк отдаём как есть, одну большую строку режем на куски
         if isinstance(b64_data, list):
-            b64_data = "".join(b64_data)
-        
-        # Убираем переносы строк
-        b64_data = b64_data.replace('\n', '')
+            chunks = b64_data
+        else:
+            chunks = (b64_data[i:i + _B64_CHUNK_SIZE]
+                      for i in range(0, len(b64_data), _B64_CHUNK_SIZE))
         
+        # Декодируем во временный файл рядом с целевым и подменяем его только
+        # при успехе — существующий файл при ошибке остаётся нетронутым
+        target_path = Path(to_file).resolve()
+        tmp_path = target_path.with_name(f"{target_path.name}.{os.getpid()}.tmp")
         try:
-            decoded_data = base64.b64decode(b64_data)
-            with open(to_file, 'wb') as f:
-                f.write(decoded_data)
+            # Декодируем потоково: в памяти только текущий кусок и хвост < 4 символов
+            with open(tmp_path, 'wb') as f:
+                pending = bytearray()
+                for chunk in chunks:
+                    pending += chunk.encode('ascii').translate(None, _B64_IGNORED)
+                    ready = len(pending) - len(pending) % 4
+                    if ready >= _B64_CHUNK_SIZE:
+                        f.write(_a2b_base64(pending[:ready]))
+                        del pending[:ready]
+                if pending:
+                    f.write(_a2b_base64(pending))
+            if target_path.is_dir():
+                raise IsADirectoryError(f"Is a directory: '{to_file}'")
+            if target_path.exists():
+                os.chmod(tmp_path, target_path.stat().st_mode & 0o7777)
+            os.replace(tmp_path, target_path)
             print(f"Saved {target_key} data from Cell {cell_index}, Output {output_index} to '{to_file}'.")
         except Exception as e:
+            # Удаляем только свой временный файл
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
             print(f"Error saving output to file: {e}")
             sys.exit(1)
 
@@ -316,15 +935,7 @@ class NotebookEditor:
         return:
             None
         """
-        new_cell = {
-            "cell_type": cell_type,
-            "metadata": {},
-            "source": self._normalize_source(content)
-        }
-        if cell_type == "code":
-            new_cell["execution_count"] = None
-            new_cell["outputs"] = []
-
+        new_cell = self._new_cell(cell_type, content)
         cells = self.data.get('cells', [])
         
         if index == -1:
@@ -372,16 +983,177 @@ class NotebookEditor:
             print(f"Error: Cell index {index} out of range.")
             sys.exit(1)
 
-        cell = cells[index]
-        cell['source'] = self._normalize_source(content)
+        self._set_cell_source(cells[index], content, clear_outputs)
+        print(f"Updated cell {index}.")
+        self.save()
+
+    def _new_cell(self, cell_type: str, content: str) -> Dict[str, Any]:
+        """
+        Создаём новую ячейку заданного типа.
+        
+        params:
+            cell_type: Тип ячейки ('code' или 'markdown')
+            content: Содержимое ячейки
+        return:
+            Dict новой ячейки
+        """
+        new_cell = {
+            "cell_type": cell_type,
+            "metadata": {},
+            # Храним строкой, в список разбиваем только при сохранении
+            "source": content
+        }
+        self._unsplit_cells.append(new_cell)
+        if cell_type == "code":
+            new_cell["execution_count"] = None
+            new_cell["outputs"] = []
+        return new_cell
+
+    def _set_cell_source(self, cell: Dict[str, Any], content: str, clear_outputs: bool):
+        """
+        Заменяем source ячейки и при необходимости очищаем её выводы.
+        
+        params:
+            cell: Объект ячейки
+            content: Новое содержимое
+            clear_outputs: Очищаем ли выводы code-ячейки
+        return:
+            None
+        """
+        # Храним строкой, в список разбиваем только при сохранении
+        cell['source'] = content
+        self._unsplit_cells.append(cell)
         
         if cell['cell_type'] == 'code' and clear_outputs:
             cell['execution_count'] = None
             cell['outputs'] = []
+
+    def apply_edits(self, edits: List[Dict[str, Any]]):
+        """
+        Применяем пачку правок одним проходом по ячейкам и одним сохранением.
+        Индексы во всех правках — позиции ячеек до применения пачки.
+        
+        params:
+            edits: Список правок:
+                {"op": "add", "index": i, "type": "code", "content": "..."} —
+                    вставка перед ячейкой i (-1 или без index = в конец);
+                {"op": "update", "index": i, "content": "...", "clear_outputs": true};
+                {"op": "delete", "index": i}
+        return:
+            None
+        """
+        cells = self.data.get('cells', [])
+        # Вставки по позиции, удаления и обновления по индексу исходной ячейки
+        inserts: Dict[int, List[Dict[str, Any]]] = {}
+        deleted = set()
+        updated: Dict[int, Dict[str, Any]] = {}
+        
+        # Сначала проверяем всю пачку, чтобы не применить её наполовину
+        for n, edit in enumerate(edits):
+            op = edit.get('op') if isinstance(edit, dict) else None
+            if op not in ('add', 'update', 'delete'):
+                print(f"Error: Edit {n}: Unknown op '{op}' (expected add, update or delete).")
+                sys.exit(1)
+            index = edit.get('index', -1 if op == 'add' else None)
+            # bool — подкласс int, но true/false индексом не считаем
+            if not isinstance(index, int) or isinstance(index, bool):
+                print(f"Error: Edit {n}: Cell index must be an integer.")
+                sys.exit(1)
+            if op == 'update' and 'content' not in edit:
+                print(f"Error: Edit {n}: Missing 'content' for update.")
+                sys.exit(1)
+            if op != 'delete' and not isinstance(edit.get('content', ''), str):
+                print(f"Error: Edit {n}: Content must be a string.")
+                sys.exit(1)
+            if op == 'update' and not isinstance(edit.get('clear_outputs', True), bool):
+                print(f"Error: Edit {n}: 'clear_outputs' must be true or false.")
+                sys.exit(1)
             
-        print(f"Updated cell {index}.")
+            if op == 'add':
+                cell_type = edit.get('type', 'code')
+                if cell_type not in ('code', 'markdown'):
+                    print(f"Error: Edit {n}: Unknown cell type '{cell_type}'.")
+                    sys.exit(1)
+                # Позицию ограничиваем так же, как add_cell
+                position = len(cells) if index == -1 else min(max(index, 0), len(cells))
+                inserts.setdefault(position, []).append(edit)
+            else:
+                if index < 0 or index >= len(cells):
+                    print(f"Error: Edit {n}: Cell index {index} out of range.")
+                    sys.exit(1)
+                if index in deleted or index in updated:
+                    print(f"Error: Edit {n}: Cell {index} is already changed by another edit.")
+                    sys.exit(1)
+                if op == 'delete':
+                    deleted.add(index)
+                else:
+                    updated[index] = edit
+        
+        if not edits:
+            print("No edits to apply.")
+            return
+        
+        # Собираем новый список за один проход вместо insert/pop на каждую правку
+        result = []
+        for i, cell in enumerate(cells):
+            for edit in inserts.get(i, ()):
+                result.append(self._new_cell(edit.get('type', 'code'), edit.get('content', '')))
+            if i in deleted:
+                continue
+            edit = updated.get(i)
+            if edit is not None:
+                self._set_cell_source(cell, edit['content'], edit.get('clear_outputs', True))
+            result.append(cell)
+        for edit in inserts.get(len(cells), ()):
+            result.append(self._new_cell(edit.get('type', 'code'), edit.get('content', '')))
+        cells[:] = result
+        
+        added = sum(len(group) for group in inserts.values())
+        print(f"Applied {len(edits)} edits: {added} added, {len(updated)} updated, {len(deleted)} deleted.")
         self.save()
 
+    def _match_lines(self, text: str, query: str,
+                     pattern: Optional[re.Pattern]) -> Optional[List[str]]:
+        """
+        Проверяем весь текст одним вызовом (в C) и отбираем строки с совпадениями
+        так же, как проверка каждой строки из text.splitlines().
+        
+        params:
+            text: Текст для поиска
+            query: Строка поиска (используется если pattern не задан)
+            pattern: Скомпилированный regex или None
+        return:
+            None если совпадений нет, иначе список совпавших строк
+        """
+        if pattern is not None:
+            if not pattern.search(text):
+                return None
+            # Regex на отдельной строке ведёт себя иначе (\A, lookbehind,
+            # совпадения через перенос) — перепроверяем каждую строку
+            return [line for line in text.splitlines() if pattern.search(line)]
+        idx = text.find(query)
+        if idx < 0:
+            return None
+        # Подстрока с переносом не лежит целиком ни в одной строке
+        if '\n' in query:
+            return []
+        # Цикл ниже идёт в Python на каждое попадание — при частых попаданиях
+        # splitlines с проверкой в C быстрее
+        if (not query or _has_rare_line_break(text)
+                or text.count(query) * _SPLIT_MIN_HIT_RATIO > text.count('\n')):
+            return [line for line in text.splitlines() if query in line]
+        # Переносы только '\n': каждое попадание уже внутри своей строки —
+        # вырезаем её по соседним переносам и ищем дальше со следующей строки
+        lines = []
+        while idx >= 0:
+            start = text.rfind('\n', 0, idx) + 1
+            end = text.find('\n', idx)
+            if end < 0:
+                end = len(text)
+            lines.append(text[start:end])
+            idx = text.find(query, end + 1)
+        return lines
+
     def search(self, query: str, use_regex: bool = False):
         """
         Ищем текст в ячейках (в коде и выводах).
@@ -393,26 +1165,29 @@ class NotebookEditor:
             None
         """
         cells = self.data.get('cells', [])
-        results = set()
+        results = []
+        
+        # Компилируем паттерн один раз на весь поиск
+        pattern = None
+        if use_regex:
+            try:
+                pattern = re.compile(query, re.MULTILINE)
+            except re.error as e:
+                print(f"Error: Invalid regex '{query}': {e}")
+                sys.exit(1)
         
+        buf = io.StringIO()
         for i, cell in enumerate(cells):
             # 1. Ищем в исходном коде
             source = self._source_to_string(cell.get('source', []))
             match_found = False
-            
-            # Вспомогательная функция для проверки совпадения
-            def check_match(text):
-                if use_regex:
-                    return bool(re.search(query, text, re.MULTILINE))
-                return query in text
 
-            if check_match(source):
+            lines = self._match_lines(source, query, pattern)
+            if lines is not None:
                 match_found = True
-                print(f"Match in Cell [{i}] SOURCE ({cell.get('cell_type')}):")
-                lines = source.splitlines()
+                buf.write(f"Match in Cell [{i}] SOURCE ({cell.get('cell_type')}):\n")
                 for line in lines:
-                    if (use_regex and re.search(query, line)) or (not use_regex and query in line):
-                        print(f"  > {line.strip()[:80]}")
+                    buf.write(f"  > {line.strip()[:80]}\n")
 
             # 2. Ищем в выводах
             outputs = cell.get('outputs', [])
@@ -425,21 +1200,23 @@ class NotebookEditor:
                 elif output.get('output_type') == 'error':
                     output_text = f"{output.get('ename', '')}: {output.get('evalue', '')}"
 
-                if output_text and check_match(output_text):
+                if not output_text:
+                    continue
+                lines = self._match_lines(output_text, query, pattern)
+                if lines is not None:
                     match_found = True
-                    print(f"Match in Cell [{i}] OUTPUT {out_idx}:")
-                    lines = output_text.splitlines()
+                    buf.write(f"Match in Cell [{i}] OUTPUT {out_idx}:\n")
                     for line in lines:
-                         if (use_regex and re.search(query, line)) or (not use_regex and query in line):
-                             print(f"  >> {line.strip()[:80]}")
+                         buf.write(f"  >> {line.strip()[:80]}\n")
 
             if match_found:
-                results.add(i)
+                results.append(i)
 
         if not results:
-            print("No matches found.")
+            buf.write("No matches found.\n")
         else:
-            print(f"Found matches in {len(results)} cells: {sorted(list(results))}")
+            buf.write(f"Found matches in {len(results)} cells: {results}\n")
+        sys.stdout.write(buf.getvalue())
 
     def show_diff(self, index: int, new_content: str):
         """
@@ -457,17 +1234,28 @@ class NotebookEditor:
             sys.exit(1)
 
         current_source = self._source_to_string(cells[index].get('source', []))
+        # Одинаковый текст — diff пуст, строки не разбиваем и не сравниваем
+        if current_source == new_content:
+            print("No differences found.")
+            return
         
         # Подготавливаем для diff
         current_lines = current_source.splitlines(keepends=True)
         new_lines = new_content.splitlines(keepends=True)
         
-        diff = difflib.unified_diff(
+        if _optional_import('cdifflib'):
+            # C-реализация SequenceMatcher с теми же опкодами
+            matcher = _optional_import('cdifflib').CSequenceMatcher(None, current_lines, new_lines)
+        else:
+            import difflib
+            matcher = difflib.SequenceMatcher(None, current_lines, new_lines)
+        
+        diff = _unified_diff(
+            matcher,
             current_lines, 
             new_lines, 
             fromfile=f'Cell {index} (Current)', 
-            tofile='New Content',
-            lineterm=''
+            tofile='New Content'
         )
         
         diff_text = "".join(diff)
@@ -489,11 +1277,9 @@ class NotebookEditor:
         cleared_count = 0
         
         if indices is None:
-            # Очищаем все code-ячейки
+            # Очищаем все code-ячейки, уже пустые не считаем
             for cell in cells:
-                if cell.get('cell_type') == 'code':
-                    cell['outputs'] = []
-                    cell['execution_count'] = None
+                if cell.get('cell_type') == 'code' and self._clear_cell_outputs(cell):
                     cleared_count += 1
             print(f"Cleared outputs of {cleared_count} code cells.")
         else:
@@ -504,14 +1290,89 @@ class NotebookEditor:
                 if cells[i].get('cell_type') != 'code':
                     print(f"Warning: Cell {i} is not a code cell, skipping.")
                     continue
-                cells[i]['outputs'] = []
-                cells[i]['execution_count'] = None
-                cleared_count += 1
+                if self._clear_cell_outputs(cells[i]):
+                    cleared_count += 1
                 print(f"Cleared output of cell {i}.")
         
+        # Сохраняем только если что-то действительно изменилось
         if cleared_count > 0:
             self.save()
 
+    def _clear_cell_outputs(self, cell: Dict[str, Any]) -> bool:
+        """
+        Очищаем выводы и счётчик выполнения code-ячейки.
+        
+        params:
+            cell: Объект ячейки
+        return:
+            True если ячейка изменилась, False если уже была очищена
+        """
+        if cell.get('outputs') == [] and cell.get('execution_count', 0) is None:
+            return False
+        cell['outputs'] = []
+        cell['execution_count'] = None
+        return True
+
+    def _shift_indent(self, lines: List[str], indent_delta: int) -> List[str]:
+        """
+        Сдвигаем отступ непустых строк на indent_delta.
+        
+        params:
+            lines: Список строк с переносами
+            indent_delta: Сколько пробелов добавить (>0) или убрать (<0)
+        return:
+            Новый список строк
+        """
+        if not indent_delta:
+            return lines
+        adjusted_lines = []
+        for line in lines:
+            if line.strip():  # Непустая строка
+                if indent_delta > 0:
+                    # Добавляем пробелы
+                    adjusted_lines.append(' ' * indent_delta + line)
+                else:
+                    # Убираем пробелы (но не больше чем есть)
+                    current_indent = len(line) - len(line.lstrip())
+                    remove = min(-indent_delta, current_indent)
+                    adjusted_lines.append(line[remove:])
+            else:
+                adjusted_lines.append(line)
+        return adjusted_lines
+
+    def _merge_unterminated(self, lines: List[str], i: int):
+        """
+        Склеиваем строку без переноса со следующей, как это сделал бы splitlines.
+        
+        params:
+            lines: Список строк source (меняется на месте)
+            i: Индекс проверяемой строки
+        return:
+            None
+        """
+        if 0 <= i < len(lines) - 1 and not lines[i].endswith(('\n', '\r')):
+            lines[i:i + 2] = [lines[i] + lines[i + 1]]
+
+    def _is_line_list(self, lines: List[str], source: str) -> bool:
+        """
+        Проверяем, что каждый элемент списка — ровно одна строка source:
+        все, кроме последнего, заканчиваются единственным '\n', последний не пуст.
+        Переносы кроме '\n' должны быть исключены заранее.
+        
+        params:
+            lines: Список строк source
+            source: Склеенный source
+        return:
+            True если список совпадает с source.splitlines(keepends=True)
+        """
+        if not lines:
+            return True
+        if not lines[-1] or not all(line.endswith('\n') for line in lines[:-1]):
+            return False
+        # Каждый элемент содержит хотя бы один '\n' (кроме, может быть, последнего),
+        # поэтому равенство с числом строк значит, что лишних переносов нет
+        return len(lines) == self._count_lines(source, False)
+
     def patch_lines(self, index: int, start_line: int, end_line: int, 
                     new_content: str, preserve_indent: bool = True, insert_mode: bool = False):
         """
@@ -532,8 +1393,17 @@ class NotebookEditor:
             print(f"Error: Cell index {index} out of range (0-{len(cells)-1})")
             sys.exit(1)
 
-        source = self._source_to_string(cells[index].get('source', []))
-        lines = source.splitlines(keepends=True)
+        cell = cells[index]
+        source = self._source_to_string(cell.get('source', []))
+        # Переносы кроме '\n' (\r, \f, ...) splitlines тоже считает строками,
+        # а '\r' + '\n' на стыке правки склеиваются — тогда разбиваем заново
+        rare_breaks = _has_rare_line_break(source) or _has_rare_line_break(new_content)
+        # Правим список строк source на месте срезами. Если source — строка
+        # или элементы списка не совпадают со строками, разбиваем один раз
+        lines = cell.setdefault('source', [])
+        if isinstance(lines, str) or rare_breaks or not self._is_line_list(lines, source):
+            lines = source.splitlines(keepends=True)
+            cell['source'] = lines
         
         # Конвертируем в 0-indexed
         start = start_line - 1
@@ -574,23 +1444,11 @@ class NotebookEditor:
                 indent_delta = original_indent - new_indent
                 
                 # Применяем дельту ко всем строкам
-                adjusted_lines = []
-                for line in new_lines:
-                    if line.strip():  # Непустая строка
-                        if indent_delta > 0:
-                            adjusted_lines.append(' ' * indent_delta + line)
-                        elif indent_delta < 0:
-                            current_indent = len(line) - len(line.lstrip())
-                            remove = min(-indent_delta, current_indent)
-                            adjusted_lines.append(line[remove:])
-                        else:
-                            adjusted_lines.append(line)
-                    else:
-                        adjusted_lines.append(line)
-                new_lines = adjusted_lines
+                new_lines = self._shift_indent(new_lines, indent_delta)
             
-            new_source = ''.join(lines[:insert_pos]) + ''.join(new_lines) + ''.join(lines[insert_pos:])
-            cells[index]['source'] = self._normalize_source(new_source)
+            lines[insert_pos:insert_pos] = new_lines
+            # Строка перед вставкой могла быть без переноса — склеиваем как splitlines
+            self._merge_unterminated(lines, insert_pos - 1)
             print(f"Inserted {len(new_lines)} lines after line {start_line} in cell {index}.")
         else:
             # Режим замены
@@ -609,27 +1467,16 @@ class NotebookEditor:
                 indent_delta = original_indent - new_indent
                 
                 # Применяем дельту ко всем строкам
-                adjusted_lines = []
-                for line in new_lines:
-                    if line.strip():  # Непустая строка
-                        if indent_delta > 0:
-                            # Добавляем пробелы
-                            adjusted_lines.append(' ' * indent_delta + line)
-                        elif indent_delta < 0:
-                            # Убираем пробелы (но не больше чем есть)
-                            current_indent = len(line) - len(line.lstrip())
-                            remove = min(-indent_delta, current_indent)
-                            adjusted_lines.append(line[remove:])
-                        else:
-                            adjusted_lines.append(line)
-                    else:
-                        adjusted_lines.append(line)
-                new_lines = adjusted_lines
+                new_lines = self._shift_indent(new_lines, indent_delta)
             
-            new_source = ''.join(lines[:start]) + ''.join(new_lines) + ''.join(lines[end:])
-            cells[index]['source'] = self._normalize_source(new_source)
+            lines[start:end] = new_lines
+            self._merge_unterminated(lines, start + len(new_lines) - 1)
+            self._merge_unterminated(lines, start - 1)
             print(f"Replaced lines {start_line}-{end_line} in cell {index}.")
         
+        if rare_breaks:
+            lines[:] = "".join(lines).splitlines(keepends=True)
+        
         # Очищаем выводы так как код изменился
         if cells[index].get('cell_type') == 'code':
             cells[index]['outputs'] = []
@@ -650,21 +1497,24 @@ class NotebookEditor:
         return:
             None
         """
-        cells = self.data.get('cells', [])
-        if index < 0 or index >= len(cells):
+        cell = self._get_cell(index)
+        if cell is None:
+            cells = self.data.get('cells', [])
             print(f"Error: Cell index {index} out of range (0-{len(cells)-1})")
             sys.exit(1)
 
-        cell = cells[index]
         source_content = self._source_to_string(cell.get('source', []))
+        line_count = self._count_lines(source_content)
         
         # Добавляем номера строк если запрошено
         if numbered:
             source_lines = source_content.splitlines(keepends=True)
+            line_count = len(source_lines)
             # Вычисляем ширину для номеров строк
             width = len(str(len(source_lines)))
-            numbered_lines = [f"{i+1:>{width}}: {line}" for i, line in enumerate(source_lines)]
-            source_content = ''.join(numbered_lines)
+            # Шаблон с фиксированной шириной собираем один раз, а не на каждой строке
+            template = "{:>%d}: {}" % width
+            source_content = ''.join(map(template.format, range(1, len(source_lines) + 1), source_lines))
         
         output_content = ""
         if include_output and 'outputs' in cell:
@@ -681,9 +1531,11 @@ class NotebookEditor:
                 print(f"Error writing to file: {e}")
                 sys.exit(1)
         else:
-            print(f"--- Cell {index} ({cell.get('cell_type')}) [{len(source_content.splitlines())} lines] ---")
-            print(full_content)
-            print("---------------------------")
+            sys.stdout.write(
+                f"--- Cell {index} ({cell.get('cell_type')}) [{line_count} lines] ---\n"
+                f"{full_content}\n"
+                "---------------------------\n"
+            )
 
     def info(self):
         """
@@ -696,28 +1548,37 @@ class NotebookEditor:
         """
         cells = self.data.get('cells', [])
         
-        code_cells = sum(1 for c in cells if c.get('cell_type') == 'code')
-        markdown_cells = sum(1 for c in cells if c.get('cell_type') == 'markdown')
-        cells_with_output = sum(1 for c in cells if c.get('outputs'))
-        
+        # Собираем всю статистику за один проход по ячейкам
+        code_cells = 0
+        markdown_cells = 0
+        cells_with_output = 0
         total_lines = 0
         for cell in cells:
-            source = self._source_to_string(cell.get('source', []))
-            total_lines += len(source.splitlines())
+            cell_type = cell.get('cell_type')
+            if cell_type == 'code':
+                code_cells += 1
+            elif cell_type == 'markdown':
+                markdown_cells += 1
+            if cell.get('outputs'):
+                cells_with_output += 1
+            total_lines += self._count_lines(self._source_to_string(cell.get('source', [])))
         
         # Получаем информацию о ядре
         kernel = self.data.get('metadata', {}).get('kernelspec', {}).get('display_name', 'Unknown')
         nbformat = self.data.get('nbformat', '?')
         nbformat_minor = self.data.get('nbformat_minor', '?')
         
-        print(f"Notebook: {self.filepath}")
-        print(f"Format: nbformat {nbformat}.{nbformat_minor}")
-        print(f"Kernel: {kernel}")
-        print(f"Cells: {len(cells)} total")
-        print(f"  - Code: {code_cells}")
-        print(f"  - Markdown: {markdown_cells}")
-        print(f"  - With outputs: {cells_with_output}")
-        print(f"Total source lines: {total_lines}")
+        # Пишем отчёт одной записью вместо print на каждую строку
+        sys.stdout.write(
+            f"Notebook: {self.filepath}\n"
+            f"Format: nbformat {nbformat}.{nbformat_minor}\n"
+            f"Kernel: {kernel}\n"
+            f"Cells: {len(cells)} total\n"
+            f"  - Code: {code_cells}\n"
+            f"  - Markdown: {markdown_cells}\n"
+            f"  - With outputs: {cells_with_output}\n"
+            f"Total source lines: {total_lines}\n"
+        )
 
     def validate(self) -> bool:
         """
@@ -742,28 +1603,33 @@ class NotebookEditor:
         # Проверяем каждую ячейку
         cells = self.data.get('cells', [])
         for i, cell in enumerate(cells):
-            if 'cell_type' not in cell:
+            cell_type = cell.get('cell_type')
+            # Обычно оба обязательных поля есть — проверяем одним сравнением множеств
+            complete = cell.keys() >= _REQUIRED_CELL_FIELDS
+            
+            if not complete and 'cell_type' not in cell:
                 errors.append(f"Cell {i}: Missing 'cell_type'")
-            elif cell['cell_type'] not in ('code', 'markdown', 'raw'):
-                warnings.append(f"Cell {i}: Unknown cell_type '{cell['cell_type']}'")
+            elif cell_type not in ('code', 'markdown', 'raw'):
+                warnings.append(f"Cell {i}: Unknown cell_type '{cell_type}'")
             
-            if 'source' not in cell:
+            if not complete and 'source' not in cell:
                 errors.append(f"Cell {i}: Missing 'source'")
             
-            if cell.get('cell_type') == 'code':
-                if 'outputs' not in cell:
-                    warnings.append(f"Cell {i}: Code cell missing 'outputs'")
+            if cell_type == 'code' and 'outputs' not in cell:
+                warnings.append(f"Cell {i}: Code cell missing 'outputs'")
         
-        # Выводим результаты
+        # Выводим результаты одной записью вместо print на каждую строку
+        report = []
         if errors:
-            print("ERRORS:")
-            for e in errors:
-                print(f"  ✗ {e}")
+            report.append("ERRORS:")
+            report.extend(f"  ✗ {e}" for e in errors)
         
         if warnings:
-            print("WARNINGS:")
-            for w in warnings:
-                print(f"  ⚠ {w}")
+            report.append("WARNINGS:")
+            report.extend(f"  ⚠ {w}" for w in warnings)
+        
+        if report:
+            sys.stdout.write("\n".join(report) + "\n")
         
         if not errors and not warnings:
             print("✓ Notebook is valid")
@@ -784,39 +1650,54 @@ class NotebookEditor:
             JSON-строка с информацией о ячейках
         """
         cells = self.data.get('cells', [])
-        result = {
-            "notebook": str(self.filepath),
-            "total_cells": len(cells),
-            "cells": []
-        }
+        # Схема фиксирована — собираем текст как json.dumps(indent=2),
+        # но без промежуточных dict и медленного Python-энкодера с отступами
+        parts = []
         
         for i, cell in enumerate(cells):
             if limit > 0 and i >= limit:
                 break
             
             source = self._source_to_string(cell.get('source', []))
-            source_lines = source.splitlines()
-            
-            cell_info = {
-                "index": i,
-                "type": cell.get('cell_type', 'unknown'),
-                "lines": len(source_lines),
-                "has_output": bool(cell.get('outputs', [])),
-                "preview_first": source_lines[0][:80] if source_lines else "",
-                "preview_last": source_lines[-1][:80] if source_lines else ""
-            }
+            if _has_rare_line_break(source):
+                # Редкие переносы (\r, \f, ...) — разбиваем как раньше
+                source_lines = source.splitlines()
+                line_count = len(source_lines)
+                preview_first = source_lines[0][:80] if source_lines else ""
+                preview_last = source_lines[-1][:80] if source_lines else ""
+            else:
+                # Только '\n' — берём крайние строки по позициям переносов
+                line_count = self._count_lines(source, False)
+                first_end = source.find('\n')
+                preview_first = source[:first_end if 0 <= first_end < 80 else 80]
+                end = len(source) - 1 if source.endswith('\n') else len(source)
+                last_start = source.rfind('\n', 0, end) + 1
+                preview_last = source[last_start:min(end, last_start + 80)]
             
             # Проверяем наличие изображений в выводах
-            for output in cell.get('outputs', []):
-                if 'data' in output:
-                    for key in output['data']:
-                        if key.startswith('image/'):
-                            cell_info["has_image"] = True
-                            break
+            outputs = cell.get('outputs', [])
+            has_image = any(key.startswith('image/')
+                            for output in outputs if 'data' in output
+                            for key in output['data'])
             
-            result["cells"].append(cell_info)
+            parts.append(
+                '    {\n'
+                f'      "index": {i},\n'
+                f'      "type": {_json_value(cell.get("cell_type", "unknown"), 3)},\n'
+                f'      "lines": {line_count},\n'
+                f'      "has_output": {"true" if outputs else "false"},\n'
+                f'      "preview_first": {_json_value(preview_first, 3)},\n'
+                f'      "preview_last": {_json_value(preview_last, 3)}'
+                + (',\n      "has_image": true' if has_image else '')
+                + '\n    }'
+            )
         
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        cells_json = '[\n' + ',\n'.join(parts) + '\n  ]' if parts else '[]'
+        return ('{\n'
+                f'  "notebook": {_json_value(str(self.filepath), 1)},\n'
+                f'  "total_cells": {len(cells)},\n'
+                f'  "cells": {cells_json}\n'
+                '}')
 
 
 def main():
@@ -826,97 +1707,107 @@ def main():
     parser = argparse.ArgumentParser(description="Agent-Native Jupyter Notebook Editor")
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
 
-    # Общий аргумент для пути к ноутбуку
-    def add_nb_arg(p):
-        p.add_argument("notebook", help="Path to the .ipynb file")
+    # Аргументы каждой команды добавляем в отдельной функции,
+    # чтобы строить только подпарсер вызванной команды
 
     # LIST
-    parser_list = subparsers.add_parser("list", help="List cells in the notebook")
-    add_nb_arg(parser_list)
-    parser_list.add_argument("--limit", type=int, default=0, help="Limit output lines")
-    parser_list.add_argument("--json", action="store_true", help="Output as JSON (for LLM parsing)")
+    def build_list(p):
+        p.add_argument("--limit", type=int, default=0, help="Limit output lines")
+        p.add_argument("--json", action="store_true", help="Output as JSON (for LLM parsing)")
 
     # READ
-    parser_read = subparsers.add_parser("read", help="Read a cell")
-    add_nb_arg(parser_read)
-    parser_read.add_argument("index", type=int, help="Cell index")
-    parser_read.add_argument("--to-file", help="Save content to this file")
-    parser_read.add_argument("--include-output", action="store_true", help="Include cell output in the result")
-    parser_read.add_argument("--numbered", action="store_true", help="Show line numbers")
+    def build_read(p):
+        p.add_argument("index", type=int, help="Cell index")
+        p.add_argument("--to-file", help="Save content to this file")
+        p.add_argument("--include-output", action="store_true", help="Include cell output in the result")
+        p.add_argument("--numbered", action="store_true", help="Show line numbers")
 
     # SEARCH
-    parser_search = subparsers.add_parser("search", help="Search in notebook")
-    add_nb_arg(parser_search)
-    parser_search.add_argument("query", help="Search query")
-    parser_search.add_argument("--regex", action="store_true", help="Use regex search")
+    def build_search(p):
+        p.add_argument("query", help="Search query")
+        p.add_argument("--regex", action="store_true", help="Use regex search")
 
     # UPDATE
-    parser_update = subparsers.add_parser("update", help="Update a cell")
-    add_nb_arg(parser_update)
-    parser_update.add_argument("index", type=int, help="Cell index")
-    group = parser_update.add_mutually_exclusive_group(required=True)
-    group.add_argument("--content", help="New content string")
-    group.add_argument("--from-file", help="Read new content from this file")
-    parser_update.add_argument("--no-clear-output", action="store_true", help="Don't clear cell outputs")
+    def build_update(p):
+        p.add_argument("index", type=int, help="Cell index")
+        group = p.add_mutually_exclusive_group(required=True)
+        group.add_argument("--content", help="New content string")
+        group.add_argument("--from-file", help="Read new content from this file")
+        p.add_argument("--no-clear-output", action="store_true", help="Don't clear cell outputs")
 
     # ADD
-    parser_add = subparsers.add_parser("add", help="Add a new cell")
-    add_nb_arg(parser_add)
-    parser_add.add_argument("--index", type=int, default=-1, help="Insertion index (-1 for end)")
-    parser_add.add_argument("--type", choices=["code", "markdown"], default="code", help="Cell type")
-    group_add = parser_add.add_mutually_exclusive_group(required=True)
-    group_add.add_argument("--content", help="Content string")
-    group_add.add_argument("--from-file", help="Read content from this file")
+    def build_add(p):
+        p.add_argument("--index", type=int, default=-1, help="Insertion index (-1 for end)")
+        p.add_argument("--type", choices=["code", "markdown"], default="code", help="Cell type")
+        group_add = p.add_mutually_exclusive_group(required=True)
+        group_add.add_argument("--content", help="Content string")
+        group_add.add_argument("--from-file", help="Read content from this file")
 
     # DELETE
-    parser_delete = subparsers.add_parser("delete", help="Delete a cell")
-    add_nb_arg(parser_delete)
-    parser_delete.add_argument("index", type=int, help="Cell index")
+    def build_delete(p):
+        p.add_argument("index", type=int, help="Cell index")
 
     # DIFF
-    parser_diff = subparsers.add_parser("diff", help="Show diff for a cell update")
-    add_nb_arg(parser_diff)
-    parser_diff.add_argument("index", type=int, help="Cell index")
-    group_diff = parser_diff.add_mutually_exclusive_group(required=True)
-    group_diff.add_argument("--content", help="New content string")
-    group_diff.add_argument("--from-file", help="Read new content from this file")
-
-    # CREATE
-    parser_create = subparsers.add_parser("create", help="Create a new empty notebook")
-    add_nb_arg(parser_create)
+    def build_diff(p):
+        p.add_argument("index", type=int, help="Cell index")
+        group_diff = p.add_mutually_exclusive_group(required=True)
+        group_diff.add_argument("--content", help="New content string")
+        group_diff.add_argument("--from-file", help="Read new content from this file")
 
     # SAVE OUTPUT
-    parser_save_output = subparsers.add_parser("save-output", help="Save binary output (image) to file")
-    add_nb_arg(parser_save_output)
-    parser_save_output.add_argument("index", type=int, help="Cell index")
-    parser_save_output.add_argument("--output-index", type=int, default=0, help="Index of the output in the cell (default 0)")
-    parser_save_output.add_argument("--to-file", required=True, help="Destination file for the output")
+    def build_save_output(p):
+        p.add_argument("index", type=int, help="Cell index")
+        p.add_argument("--output-index", type=int, default=0, help="Index of the output in the cell (default 0)")
+        p.add_argument("--to-file", required=True, help="Destination file for the output")
+
+    # BATCH
+    def build_batch(p):
+        p.add_argument("--from-file", required=True, help="Read a JSON list of edits from this file")
 
     # CLEAR-OUTPUT
-    parser_clear = subparsers.add_parser("clear-output", help="Clear cell outputs")
-    add_nb_arg(parser_clear)
-    clear_group = parser_clear.add_mutually_exclusive_group(required=True)
-    clear_group.add_argument("--all", action="store_true", help="Clear outputs of all code cells")
-    clear_group.add_argument("--cells", type=int, nargs="+", help="Cell indices to clear")
+    def build_clear(p):
+        clear_group = p.add_mutually_exclusive_group(required=True)
+        clear_group.add_argument("--all", action="store_true", help="Clear outputs of all code cells")
+        clear_group.add_argument("--cells", type=int, nargs="+", help="Cell indices to clear")
 
     # PATCH
-    parser_patch = subparsers.add_parser("patch", help="Edit specific lines in a cell")
-    add_nb_arg(parser_patch)
-    parser_patch.add_argument("index", type=int, help="Cell index")
-    parser_patch.add_argument("--lines", required=True, help="Line range to replace (e.g. 5-10)")
-    patch_group = parser_patch.add_mutually_exclusive_group(required=True)
-    patch_group.add_argument("--content", help="New content string")
-    patch_group.add_argument("--from-file", help="Read new content from this file")
-    parser_patch.add_argument("--insert", action="store_true", help="Insert after start line instead of replacing")
-    parser_patch.add_argument("--no-preserve-indent", action="store_true", help="Don't preserve original indentation")
-
-    # INFO
-    parser_info = subparsers.add_parser("info", help="Show notebook metadata and statistics")
-    add_nb_arg(parser_info)
-
-    # VALIDATE
-    parser_validate = subparsers.add_parser("validate", help="Validate notebook structure")
-    add_nb_arg(parser_validate)
+    def build_patch(p):
+        p.add_argument("index", type=int, help="Cell index")
+        p.add_argument("--lines", required=True, help="Line range to replace (e.g. 5-10)")
+        patch_group = p.add_mutually_exclusive_group(required=True)
+        patch_group.add_argument("--content", help="New content string")
+        patch_group.add_argument("--from-file", help="Read new content from this file")
+        p.add_argument("--insert", action="store_true", help="Insert after start line instead of replacing")
+        p.add_argument("--no-preserve-indent", action="store_true", help="Don't preserve original indentation")
+
+    # Команда -> (справка, функция добавления аргументов); CREATE/INFO/VALIDATE
+    # принимают только путь к ноутбуку
+    commands = {
+        "list": ("List cells in the notebook", build_list),
+        "read": ("Read a cell", build_read),
+        "search": ("Search in notebook", build_search),
+        "update": ("Update a cell", build_update),
+        "add": ("Add a new cell", build_add),
+        "delete": ("Delete a cell", build_delete),
+        "diff": ("Show diff for a cell update", build_diff),
+        "create": ("Create a new empty notebook", None),
+        "save-output": ("Save binary output (image) to file", build_save_output),
+        "clear-output": ("Clear cell outputs", build_clear),
+        "patch": ("Edit specific lines in a cell", build_patch),
+        "batch": ("Apply several add/update/delete edits at once", build_batch),
+        "info": ("Show notebook metadata and statistics", None),
+        "validate": ("Validate notebook structure", None),
+    }
+
+    # Строим только подпарсер вызванной команды; для справки и ошибок — все
+    requested = sys.argv[1] if len(sys.argv) > 1 else None
+    for name in ([requested] if requested in commands else commands):
+        help_text, build = commands[name]
+        p = subparsers.add_parser(name, help=help_text)
+        # Общий аргумент для пути к ноутбуку
+        p.add_argument("notebook", help="Path to the .ipynb file")
+        if build:
+            build(p)
 
     args = parser.parse_args()
 
@@ -924,7 +1815,9 @@ def main():
         parser.print_help()
         sys.exit(1)
 
-    editor = NotebookEditor(args.notebook)
+    # Этим командам не нужны бинарные выводы и сохранение
+    read_only = args.command in ("list", "read", "search", "info", "validate")
+    editor = NotebookEditor(args.notebook, read_only=read_only)
 
     # Вспомогательная функция для получения контента
     def get_content(args_obj):
@@ -995,6 +1888,18 @@ def main():
             insert_mode=args.insert
         )
 
+    elif args.command == "batch":
+        try:
+            with open(args.from_file, 'rb') as f:
+                edits = _loads(f.read())
+        except Exception as e:
+            print(f"Error reading edits file: {e}")
+            sys.exit(1)
+        if not isinstance(edits, list):
+            print("Error: Edits file must contain a JSON list of edits.")
+            sys.exit(1)
+        editor.apply_edits(edits)
+
     elif args.command == "info":
         editor.info()
 